@@ -1,7 +1,11 @@
 import click
+from datetime import datetime
+import functools
 from pathlib import Path
 import tomli
 import logging
+import os
+import sys
 
 from sar_antarctica.nci.filesystem import get_orbits_nci
 from sar_antarctica.nci.submission.pyrosar_gamma.prepare_input import (
@@ -23,6 +27,25 @@ from sar_antarctica.nci.upload.push_folder_to_s3 import push_files_in_folder_to_
 
 logging.basicConfig(level=logging.INFO)
 
+# GDAL/PROJ settings for reading DEM tiles on the NCI. Compute nodes are offline,
+# and skipping the directory listing on open avoids probing for sidecar files
+# for every tile.
+GDAL_ENV_DEFAULTS = {
+    "GDAL_CACHEMAX": "512",
+    "GDAL_DISABLE_READDIR_ON_OPEN": "EMPTY_DIR",
+    "VSI_CACHE": "TRUE",
+    "CPL_VSIL_CURL_CACHE_SIZE": "200000000",
+    "PROJ_NETWORK": "OFF",
+    "GDAL_NUM_THREADS": "ALL_CPUS",
+}
+
+
+def configure_gdal_environment():
+    """Set the GDAL_ENV_DEFAULTS environment variables, keeping any already set"""
+    for key, value in GDAL_ENV_DEFAULTS.items():
+        os.environ.setdefault(key, value)
+
+
 @click.command()
 @click.argument("scene_name", type=str)
 def find_scene_file(scene_name):
@@ -133,6 +156,7 @@ def run_pyrosar_gamma_workflow(
     gamma_lib_dir,
     gamma_env_var,
 ):
+    configure_gdal_environment()
 
     click.echo("Preparing orbit and DEM")
     dem_output_dir = output_dir / "data/dem"
@@ -156,25 +180,32 @@ def run_pyrosar_gamma_workflow(
     )
 
 
+@functools.lru_cache(maxsize=256)
+def parse_scene(scene: str) -> tuple[str, datetime, datetime]:
+    """Parse the sensor, start and stop time from a scene ID in one step. Results
+    are cached for scenes that are looked up repeatedly, e.g. when the CLI
+    functions are called in a batch processing loop."""
+    return (parse_scene_file_sensor(scene), *parse_scene_file_dates(scene))
+
+
 @click.command()
 @click.argument("scene")
 def find_orbits_for_scene(scene: str):
-    sensor = parse_scene_file_sensor(scene)
-    start_time, stop_time = parse_scene_file_dates(scene)
+    configure_gdal_environment()
+
+    sensor, start_time, stop_time = parse_scene(scene)
 
     poe_paths = get_orbits_nci("POE", sensor)
     relevent_poe_paths = filter_orbits_to_cover_time_window(
         poe_paths, start_time, stop_time
     )
-    for orbit in relevent_poe_paths:
-        print(orbit["orbit"])
+    sys.stdout.write("".join(f"{orbit['orbit']}\n" for orbit in relevent_poe_paths))
 
     res_paths = get_orbits_nci("RES", sensor)
     relevant_res_paths = filter_orbits_to_cover_time_window(
         res_paths, start_time, stop_time
     )
-    for orbit in relevant_res_paths:
-        print(orbit["orbit"])
+    sys.stdout.write("".join(f"{orbit['orbit']}\n" for orbit in relevant_res_paths))
 
 
 @click.command()
@@ -1,10 +1,118 @@
+import hashlib
 import os
+import re
+import subprocess
+import tempfile
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from fnmatch import fnmatchcase
 from pathlib import Path
-from typing import Generator
+from typing import Generator, Iterable
 
+from osgeo import gdal
+from shapely.geometry import box
 
-def find_tiles(source_dir: Path, pattern: str) -> Generator[Path, None, None]:
-    """_summary_
+# The GTI (GDAL Raster Tile Index) driver was added in GDAL 3.9
+GTI_MIN_GDAL_VERSION = 3090000
+# Threads used to scan directories in parallel when finding tiles
+FIND_TILES_WORKERS = 16
+
+COP30_SOURCE_DIR = Path("/g/data/v10/eoancillarydata-2/elevation/copernicus_30m_world")
+COP30_PATTERN = "Copernicus_DSM_COG_10_???_00_????_00_DEM/*.tif"
+COP30_DEM_CACHE_DIR = Path("/g/data/yp75/projects/ancillary/dem/dem_cache")
+
+
+def matches_pattern(parts: tuple[str, ...], pattern_parts: tuple[str, ...]) -> bool:
+    """Check whether the trailing components of a relative path match a pattern,
+    the same way `Path.rglob` matches
+
+    Parameters
+    ----------
+    parts : tuple[str, ...]
+        Components of a path relative to the search directory
+        e.g. ("DEM_folder", "DEM_file.tif")
+    pattern_parts : tuple[str, ...]
+        Components of the pattern
+        e.g. ("DEM_folder", "*.tif")
+
+    Returns
+    -------
+    bool
+        True if the path matches the pattern
+    """
+    if len(parts) < len(pattern_parts):
+        return False
+
+    trailing_parts = parts[len(parts) - len(pattern_parts) :]
+
+    return all(
+        fnmatchcase(part, pattern_part)
+        for part, pattern_part in zip(trailing_parts, pattern_parts)
+    )
+
+
+def scan_directory(
+    directory: str,
+    relative_parts: tuple[str, ...],
+    pattern_parts: tuple[str, ...],
+    recursive: bool = True,
+) -> list[str]:
+    """Recursively scan a directory for files matching a pattern. As with
+    `Path.rglob`, the contents of symlinked directories are matched, but
+    symlinked directories are not descended into any further, and directories
+    that can't be read are skipped.
+
+    Parameters
+    ----------
+    directory : str
+        The directory to scan
+    relative_parts : tuple[str, ...]
+        Components of `directory` relative to the top level search directory
+    pattern_parts : tuple[str, ...]
+        Components of the pattern to match
+    recursive : bool, optional
+        Whether to scan subdirectories of `directory`, by default True.
+        False is used for symlinked directories.
+
+    Returns
+    -------
+    list[str]
+        Paths of all matching files below `directory`
+    """
+    matches = []
+    directories = [(directory, relative_parts, recursive)]
+
+    while directories:
+        current_dir, current_parts, current_recursive = directories.pop()
+        try:
+            entries = os.scandir(current_dir)
+        except PermissionError:
+            # unreadable directories are skipped, as with Path.rglob
+            continue
+        with entries:
+            for entry in entries:
+                entry_parts = current_parts + (entry.name,)
+                if entry.is_dir():
+                    if current_recursive:
+                        directories.append(
+                            (entry.path, entry_parts, not entry.is_symlink())
+                        )
+                elif matches_pattern(entry_parts, pattern_parts):
+                    matches.append(entry.path)
+
+    return matches
+
+
+def find_tiles(
+    source_dir: Path, pattern: str, workers: int = FIND_TILES_WORKERS
+) -> Generator[str, None, None]:
+    """Recursively find all files below a directory that match a pattern. Each
+    subdirectory of `source_dir` is scanned in a separate thread, so directory reads
+    on network filesystems (e.g. Lustre on the NCI) are made in parallel.
+
+    Where the pattern has a directory component (e.g. DEM_folder/*.tif), only
+    subdirectories of `source_dir` matching the first component are scanned, so
+    those directories are expected directly below `source_dir`.
 
     Parameters
     ----------
@@ -13,21 +121,105 @@ def find_tiles(source_dir: Path, pattern: str) -> Generator[Path, None, None]:
     pattern : str
         The pattern to search for
         e.g. DEM_folder/*.tif
+    workers : int, optional
+        Number of threads used to scan subdirectories, by default FIND_TILES_WORKERS
 
     Returns
     -------
-    Generator[Path, None, None]
-        A generator that yeilds `Path` objects for all files matching the pattern
+    Generator[str, None, None]
+        A generator that yeilds paths for all files matching the pattern
         e.g. /path/to/DEM_folder/DEM_file.tif
     """
+    pattern_parts = tuple(pattern.split("/"))
+
+    with os.scandir(source_dir) as entries:
+        top_level_entries = list(entries)
+
+    subdirectories = []
+    for entry in top_level_entries:
+        if entry.is_dir():
+            if len(pattern_parts) == 1 or fnmatchcase(entry.name, pattern_parts[0]):
+                subdirectories.append(entry)
+        elif matches_pattern((entry.name,), pattern_parts):
+            yield entry.path
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(
+            lambda entry: scan_directory(
+                entry.path,
+                (entry.name,),
+                pattern_parts,
+                recursive=not entry.is_symlink(),
+            ),
+            subdirectories,
+        )
+        for matches in results:
+            for match in matches:
+                yield match
+
+
+def write_tile_list(tiles: Iterable[str | os.PathLike]) -> Path:
+    """Write tile paths to a temporary text file, one per line, so they can be checked.
+    The file is not deleted, so should be removed once it has been checked.
+
+    Parameters
+    ----------
+    tiles : Iterable[str | os.PathLike]
+        A generator (or list) that provides paths (`str` or `Path`) for tiles
+
+    Returns
+    -------
+    Path
+        The path to the list of tiles
+    """
+    f = tempfile.NamedTemporaryFile(mode="w", suffix=".txt", delete=False)
+    try:
+        with f:
+            f.writelines(os.fspath(tile) + "\n" for tile in tiles)
+    except BaseException:
+        # don't leave a partial list behind
+        os.unlink(f.name)
+        raise
+
+    return Path(f.name)
+
 
-    tiles = source_dir.rglob(pattern)
+def run_with_tile_list(command: list[str], tiles: Iterable[str | os.PathLike]):
+    """Run a GDAL command line utility, streaming tile paths to it through stdin.
+    The command is expected to read its file list from /vsistdin/.
 
-    return tiles
+    Parameters
+    ----------
+    command : list[str]
+        The command and its arguments
+        e.g. ["gdalbuildvrt", "-input_file_list", "/vsistdin/", "out.vrt"]
+    tiles : Iterable[str | os.PathLike]
+        A generator (or list) that provides paths (`str` or `Path`) for tiles
+
+    Raises
+    ------
+    subprocess.CalledProcessError
+        The command exited with a non-zero return code
+    """
+    process = subprocess.Popen(command, stdin=subprocess.PIPE, text=True)
+    try:
+        with process.stdin as stdin:
+            stdin.writelines(os.fspath(tile) + "\n" for tile in tiles)
+    except BrokenPipeError:
+        # The command exited early, the return code reports why
+        pass
+    except BaseException:
+        process.kill()
+        process.wait()
+        raise
+
+    returncode = process.wait()
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, command)
 
 
 def build_vrt(
-    tiles: Generator[Path, None, None] | list[Path],
+    tiles: Iterable[str | os.PathLike],
     vrt_path: str | os.PathLike,
     run: bool = True,
 ):
@@ -35,26 +227,51 @@ def build_vrt(
 
     Parameters
     ----------
-    tiles : Generator[Path, None, None] | list[Path]
-        A generator (or list) that provides `Path` objects for tiles
+    tiles : Iterable[str | os.PathLike]
+        A generator (or list) that provides paths (`str` or `Path`) for tiles
         e.g. /path/to/DEM_folder/DEM_file.tif
     vrt_path : str | os.PathLike
         Where to write the VRT to, ending in .vrt
     run : bool, optional
         Whether to run the step to create the VRT, by default True
-        Can use False to generate the temporary file and check
-    """
-    with open("temp.txt", "w") as f:
-        f.writelines(f"{tile}\n" for tile in tiles)
+        Can use False to write the list of tiles to a temporary file and check
 
+    Returns
+    -------
+    Path | None
+        The path to the list of tiles if `run` is False, otherwise None
+    """
     if run:
-        os.system(f"gdalbuildvrt -input_file_list temp.txt {vrt_path}")
+        run_with_tile_list(
+            ["gdalbuildvrt", "-input_file_list", "/vsistdin/", str(vrt_path)], tiles
+        )
+        remove_source_block_sizes(vrt_path)
+    else:
+        return write_tile_list(tiles)
+
+
+def remove_source_block_sizes(vrt_path: str | os.PathLike):
+    """Remove the BlockXSize and BlockYSize attributes from the SourceProperties
+    of each source in a VRT. GDAL then uses the block size of the source itself
+    (e.g. the tile size of a COG), rather than reading a source one scanline at a
+    time when a single line block size was recorded.
+
+    Parameters
+    ----------
+    vrt_path : str | os.PathLike
+        The VRT to update in place
+    """
+    tree = ET.parse(vrt_path)
 
-        os.remove("temp.txt")
+    for source_properties in tree.iter("SourceProperties"):
+        source_properties.attrib.pop("BlockXSize", None)
+        source_properties.attrib.pop("BlockYSize", None)
+
+    tree.write(vrt_path)
 
 
 def build_tileindex(
-    tiles: Generator[Path, None, None] | list[Path],
+    tiles: Iterable[str | os.PathLike],
     tindex_path: str | os.PathLike,
     run: bool = True,
 ):
@@ -62,31 +279,258 @@ def build_tileindex(
 
     Parameters
     ----------
-    tiles : Generator[Path, None, None]
-        A generator (or list) that provides `Path` objects for tiles
+    tiles : Iterable[str | os.PathLike]
+        A generator (or list) that provides paths (`str` or `Path`) for tiles
         e.g. /path/to/DEM_folder/DEM_file.tif
     vrt_path : str | os.PathLike
         Where to write the tile index to, ending in .gpkg
     run : bool, optional
         Whether to run the step to create the tile index, by default True
-        Can use False to generate the temporary file and check
+        Can use False to write the list of tiles to a temporary file and check
+
+    Returns
+    -------
+    Path | None
+        The path to the list of tiles if `run` is False, otherwise None
     """
-    with open("temp.txt", "w") as f:
-        f.writelines(f"{tile}\n" for tile in tiles)
+    if run:
+        run_with_tile_list(
+            ["gdaltindex", str(tindex_path), "--optfile", "/vsistdin/"], tiles
+        )
+    else:
+        return write_tile_list(tiles)
+
 
+def build_gti(
+    tiles: Iterable[str | os.PathLike],
+    gti_path: str | os.PathLike,
+    run: bool = True,
+):
+    """Generic function for building a GDAL Raster Tile Index (GTI) from a generator of
+    tile paths. The index is written to a GeoPackage, which carries an R-tree spatial
+    index so reads for a set of bounds only open the intersecting tiles.
+
+    Parameters
+    ----------
+    tiles : Iterable[str | os.PathLike]
+        A generator (or list) that provides paths (`str` or `Path`) for tiles
+        e.g. /path/to/DEM_folder/DEM_file.tif
+    gti_path : str | os.PathLike
+        Where to write the tile index to, ending in .gti.gpkg so it can be opened
+        directly by the GTI driver. An existing index at this path is replaced
+    run : bool, optional
+        Whether to run the step to create the tile index, by default True
+        Can use False to write the list of tiles to a temporary file and check
+
+    Returns
+    -------
+    Path | None
+        The path to the list of tiles if `run` is False, otherwise None
+    """
     if run:
-        os.system(f"gdaltindex {tindex_path} --optfile temp.txt")
+        run_with_tile_list(
+            [
+                "gdaltindex",
+                "-overwrite",
+                "-f",
+                "GPKG",
+                str(gti_path),
+                "--optfile",
+                "/vsistdin/",
+            ],
+            tiles,
+        )
+    else:
+        return write_tile_list(tiles)
+
+
+def parse_copdem_tile_bounds(tile: str | os.PathLike) -> tuple[int, int, int, int]:
+    """Get the bounds of a Copernicus DEM tile from its file or folder name. Names
+    give the latitude and longitude of the lower left corner of a 1 degree tile.
+
+    Parameters
+    ----------
+    tile : str | os.PathLike
+        Path to the tile
+        e.g. /path/to/Copernicus_DSM_COG_10_S80_00_E178_00_DEM/Copernicus_DSM_COG_10_S80_00_E178_00_DEM.tif
+
+    Returns
+    -------
+    tuple[int, int, int, int]
+        The bounds of the tile (min_lon, min_lat, max_lon, max_lat)
+        e.g. (178, -80, 179, -79)
+
+    Raises
+    ------
+    ValueError
+        Did not find the expected Copernicus_DSM_COG_XX_<lat>_00_<lon>_00_DEM pattern
+    """
+    pattern = r"Copernicus_DSM_COG_\d{2}_([NS])(\d{2})_00_([EW])(\d{3})_00_DEM"
+
+    match = re.search(pattern, os.fspath(tile))
+
+    if not match:
+        raise ValueError(
+            f"Could not find a Copernicus DEM tile name in {tile}. "
+            "Expected Copernicus_DSM_COG_XX_<lat>_00_<lon>_00_DEM."
+        )
+
+    lat_dir, lat, lon_dir, lon = match.groups()
+    min_lat = int(lat) if lat_dir == "N" else -int(lat)
+    min_lon = int(lon) if lon_dir == "E" else -int(lon)
+
+    return (min_lon, min_lat, min_lon + 1, min_lat + 1)
 
-        os.remove("temp.txt")
 
+def filter_tiles_to_bounds(
+    tiles: Iterable[str | os.PathLike], bounds: tuple
+) -> Generator[str | os.PathLike, None, None]:
+    """Filter Copernicus DEM tiles to those intersecting a set of bounds, using the
+    tile bounds given by their names rather than opening each tile
+
+    Parameters
+    ----------
+    tiles : Iterable[str | os.PathLike]
+        A generator (or list) that provides paths (`str` or `Path`) for tiles
+    bounds : tuple
+        the set of bounds (min_lon, min_lat, max_lon, max_lat)
+
+    Returns
+    -------
+    Generator[str | os.PathLike, None, None]
+        A generator that yeilds the tiles intersecting the bounds
+    """
+    bounding_box = box(*bounds)
+
+    for tile in tiles:
+        if box(*parse_copdem_tile_bounds(tile)).intersects(bounding_box):
+            yield tile
 
-def create_glo30_dem_south_vrt():
-    """Create a VRT for the Copernicus Global 30m DEM on NCI"""
 
-    SOURCE_DIR = Path("/g/data/v10/eoancillarydata-2/elevation/copernicus_30m_world")
+def gdal_supports_gti() -> bool:
+    """Check whether the installed GDAL has the GTI driver (GDAL >= 3.9)
+
+    Returns
+    -------
+    bool
+        True if a GTI can be built and read
+    """
+    return int(gdal.VersionInfo("VERSION_NUM")) >= GTI_MIN_GDAL_VERSION
+
+
+def create_glo30_dem_south_vrt(
+    aoi_bounds: tuple | None = None, output_dir: Path | None = None
+) -> Path:
+    """Create a tile index for the Copernicus Global 30m DEM on NCI. A GTI is built
+    where GDAL supports it, otherwise a VRT is built.
+
+    Parameters
+    ----------
+    aoi_bounds : tuple | None, optional
+        Only include tiles intersecting these bounds (min_lon, min_lat, max_lon, max_lat),
+        by default None (include all tiles)
+    output_dir : Path | None, optional
+        Folder to write the tile index to, by default None (the folder of the shared
+        site-wide index). Required when `aoi_bounds` is given, so a filtered index
+        never overwrites the shared one. The file name is chosen to match the format
+        built, copdem_south.gti.gpkg for a GTI or copdem_south.vrt for a VRT.
+
+    Returns
+    -------
+    Path
+        The path to the tile index
+
+    Raises
+    ------
+    ValueError
+        `aoi_bounds` was given without an `output_dir`
+    """
+
     PATTERN = "Copernicus_DSM_COG_10_S??_00_????_00_DEM/*.tif"
-    VRT_PATH = Path("/g/data/yp75/projects/ancillary/dem/copdem_south.vrt")
+    INDEX_DIR = Path("/g/data/yp75/projects/ancillary/dem")
+    VRT_NAME = "copdem_south.vrt"
+    GTI_NAME = "copdem_south.gti.gpkg"
+
+    if aoi_bounds is not None and output_dir is None:
+        raise ValueError("An output_dir is required when aoi_bounds is given")
+    index_dir = INDEX_DIR if output_dir is None else Path(output_dir)
+
+    tiles = find_tiles(COP30_SOURCE_DIR, PATTERN)
+    if aoi_bounds is not None:
+        tiles = filter_tiles_to_bounds(tiles, aoi_bounds)
+
+    if gdal_supports_gti():
+        index_path = index_dir / GTI_NAME
+        build_gti(tiles, index_path)
+    else:
+        index_path = index_dir / VRT_NAME
+        build_vrt(tiles, index_path)
+
+    return index_path
+
+
+def build_vrt_for_bounds(
+    aoi_bounds: tuple,
+    cache_dir: Path = COP30_DEM_CACHE_DIR,
+    source_dir: Path = COP30_SOURCE_DIR,
+    pattern: str = COP30_PATTERN,
+) -> Path:
+    """Build a VRT of only the Copernicus DEM tiles that intersect a set of bounds.
+    VRTs are cached by bounds, source directory and pattern, so repeat calls for
+    the same bounds reuse the existing VRT.
+
+    Parameters
+    ----------
+    aoi_bounds : tuple
+        the set of bounds (min_lon, min_lat, max_lon, max_lat)
+        e.g. the bounds of a Sentinel-1 scene
+    cache_dir : Path, optional
+        Folder to write the VRTs to, by default COP30_DEM_CACHE_DIR
+    source_dir : Path, optional
+        The directory containing the DEM tiles, by default COP30_SOURCE_DIR
+    pattern : str, optional
+        The pattern to search for tiles, by default COP30_PATTERN
+
+    Returns
+    -------
+    Path
+        The path to the VRT
+
+    Raises
+    ------
+    ValueError
+        No tiles were found that intersect the bounds
+    """
+    # the tile source is part of the key, so caches are not shared between sources
+    cache_key = repr(
+        (
+            tuple(float(b) for b in aoi_bounds),
+            os.path.abspath(source_dir),
+            pattern,
+        )
+    )
+    cache_hash = hashlib.sha1(cache_key.encode()).hexdigest()
+    vrt_path = Path(cache_dir) / f"{cache_hash}.vrt"
+
+    if vrt_path.exists():
+        return vrt_path
+
+    tiles = list(filter_tiles_to_bounds(find_tiles(source_dir, pattern), aoi_bounds))
+    if not tiles:
+        raise ValueError(f"No DEM tiles were found that intersect {aoi_bounds}")
 
-    tiles = find_tiles(SOURCE_DIR, PATTERN)
+    # build under a unique name in the cache folder and move into place, so
+    # concurrent builds for the same bounds (from any node) never leave a partial
+    # VRT in the cache. Staying on the same filesystem keeps os.replace atomic
+    vrt_path.parent.mkdir(parents=True, exist_ok=True)
+    fd, temp_vrt_path = tempfile.mkstemp(dir=vrt_path.parent, suffix=".vrt")
+    os.close(fd)
+    temp_vrt_path = Path(temp_vrt_path)
+    try:
+        build_vrt(tiles, temp_vrt_path)
+        os.replace(temp_vrt_path, vrt_path)
+    finally:
+        if temp_vrt_path.exists():
+            os.remove(temp_vrt_path)
 
-    build_vrt(tiles, VRT_PATH)
+    return vrt_path
@@ -116,7 +116,11 @@ def remove_geoid(
         geoid_profile = translate_profile(geoid_profile, shift, shift)
 
     geoid_offset, _ = reproject_arr_to_match_profile(
-        geoid_arr, geoid_profile, dem_profile, resampling="bilinear"
+        geoid_arr,
+        geoid_profile,
+        dem_profile,
+        resampling="bilinear",
+        num_threads=os.cpu_count(),
     )
 
     dem_arr_offset = dem_arr + geoid_offset
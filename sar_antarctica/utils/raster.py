@@ -1,28 +1,72 @@
 from typing import Union
+from concurrent.futures import ProcessPoolExecutor
+import functools
+import math
 import os
 
 import numpy as np
 import pyproj
+from affine import Affine
 from osgeo import gdal
 from shapely.geometry import box
 import rasterio
 from pyproj import Transformer
 from rasterio.transform import from_origin, array_bounds
-from rasterio.warp import calculate_default_transform, reproject
+from rasterio.warp import calculate_default_transform
 from rasterio.enums import Resampling
 from rasterio.io import MemoryFile
+from rasterio.vrt import WarpedVRT
 from rasterio.merge import merge
 from rasterio.windows import Window
 from rasterio.crs import CRS
 from rasterio.windows import from_bounds
 
+# Working memory available to gdal warp operations (MB)
+WARP_MEM_LIMIT = 512
+# Maximum number of pixels per band reprojected at a time
+REPROJECT_BLOCK_PIXELS = 2048 * 2048
+# Creation options for GeoTIFFs written from a VRT, as rasterio profile keys
+# and as gdal creation options
+TIFF_CREATION_PROFILE = {
+    "tiled": True,
+    "compress": "DEFLATE",
+    "blockxsize": 512,
+    "blockysize": 512,
+    "num_threads": "ALL_CPUS",
+}
+TIFF_CREATION_OPTIONS = [
+    "TILED=YES",
+    "COMPRESS=DEFLATE",
+    "BLOCKXSIZE=512",
+    "BLOCKYSIZE=512",
+    "NUM_THREADS=ALL_CPUS",
+]
+
+
+@functools.lru_cache(maxsize=64)
+def epsg_to_crs(code: int) -> pyproj.CRS:
+    """Cached construction of a pyproj CRS from an EPSG code, avoiding a lookup
+    in the PROJ database every time the same CRS is used
+
+    Parameters
+    ----------
+    code : int
+        EPSG code, e.g. 3031
+
+    Returns
+    -------
+    pyproj.CRS
+        The coordinate reference system
+    """
+    return pyproj.CRS.from_epsg(code)
+
 
 def bounds_from_profile(profile):
     # returns the bounds from a rasterio profile dict
     return array_bounds(profile["height"], profile["width"], profile["transform"])
 
 
-def reproject_raster(src_path: str, out_path: str, crs: int):
+def reproject_raster(src_path: str, out_path: str, crs: int, num_threads: int = None):
     """Reproject raster to desired crs
 
     Parameters
@@ -33,6 +77,8 @@ def reproject_raster(src_path: str, out_path: str, crs: int):
         where to write reprj raster
     crs : int
         desired crs
+    num_threads : int, optional
+        threads used by gdal warp, by default None (all cpus)
 
     Returns
     -------
@@ -47,23 +93,74 @@ def reproject_raster(src_path: str, out_path: str, crs: int):
         kwargs = src.meta.copy()
 
         # get crs proj
-        crs = pyproj.CRS(f"EPSG:{crs}")
+        crs = epsg_to_crs(crs)
 
         kwargs.update(
             {"crs": crs, "transform": transform, "width": width, "height": height}
         )
 
-        with rasterio.open(out_path, "w", **kwargs) as dst:
-            for i in range(1, src.count + 1):
-                reproject(
-                    source=rasterio.band(src, i),
-                    destination=rasterio.band(dst, i),
-                    src_transform=src.transform,
-                    src_crs=src.crs,
-                    dst_transform=transform,
-                    dst_crs=crs,
-                    resampling=Resampling.nearest,
-                )
+        # warp on the fly through a vrt, writing blocks of rows so that only
+        # part of the raster is held in memory at a time
+        with WarpedVRT(
+            src,
+            crs=crs,
+            transform=transform,
+            width=width,
+            height=height,
+            resampling=Resampling.nearest,
+            warp_mem_limit=WARP_MEM_LIMIT,
+            num_threads=num_threads or os.cpu_count(),
+        ) as vrt:
+            with rasterio.open(out_path, "w", **kwargs) as dst:
+                rows_per_block = max(1, REPROJECT_BLOCK_PIXELS // width)
+                for row_off in range(0, height, rows_per_block):
+                    window = Window(
+                        0, row_off, width, min(rows_per_block, height - row_off)
+                    )
+                    dst.write(vrt.read(window=window), window=window)
+
+
+def set_single_threaded_gdal():
+    # initialise a worker process to run gdal with one thread, so that
+    # many workers can run at once without oversubscribing the cpus
+    os.environ["GDAL_NUM_THREADS"] = "1"
+
+
+def reproject_rasters(
+    src_paths: list[str], out_dir: str, crs: int, workers: int = None
+) -> list[str]:
+    """Reproject many rasters to the desired crs, one raster per process
+
+    Parameters
+    ----------
+    src_paths : list[str]
+        source rasters
+    out_dir : str
+        folder to write the reprojected rasters to, using the source file names
+    crs : int
+        desired crs
+    workers : int, optional
+        number of processes, by default None (one per cpu)
+
+    Returns
+    -------
+    list[str]
+        paths to the reprojected rasters
+    """
+    out_paths = [
+        os.path.join(out_dir, os.path.basename(src_path)) for src_path in src_paths
+    ]
+    with ProcessPoolExecutor(
+        max_workers=workers or os.cpu_count(), initializer=set_single_threaded_gdal
+    ) as executor:
+        list(
+            executor.map(
+                functools.partial(reproject_raster, crs=crs, num_threads=1),
+                src_paths,
+                out_paths,
+            )
+        )
+    return out_paths
 
 
 def expand_raster_to_bounds(
@@ -122,54 +219,96 @@ def expand_raster_to_bounds(
     lon_res = abs(src_profile["transform"].a)  # Pixel width
     lat_res = abs(src_profile["transform"].e)  # Pixel height
 
+    if src_array is not None:
+        if src_array.ndim == 2:
+            src_array = src_array[np.newaxis, ...]
+        # nodata in the source is replaced with the fill value
+        nodata = src_profile["nodata"]
+        if nodata is None:
+            valid = True
+        elif np.isnan(nodata):
+            valid = ~np.isnan(src_array)
+        else:
+            valid = src_array != nodata
+
+    # nothing to expand if the source already contains the target bounds
+    if (
+        src_left < trg_left
+        and src_right > trg_right
+        and src_bottom < trg_bottom
+        and src_top > trg_top
+    ):
+        trg_profile = src_profile.copy()
+        if src_array is not None:
+            trg_profile["count"] = src_array.shape[0]
+            trg_array = np.full(
+                src_array.shape, fill_value=fill_value, dtype=src_profile["dtype"]
+            )
+            np.copyto(trg_array, src_array, where=valid, casting="unsafe")
+        else:
+            trg_array = np.full(
+                (1, src_profile["height"], src_profile["width"]),
+                fill_value=fill_value,
+                dtype=src_profile["dtype"],
+            )
+        if save_path:
+            with rasterio.open(save_path, "w", **trg_profile) as dst:
+                dst.write(trg_array)
+        return trg_array, trg_profile
+
     # determine the number of new pixels in each direction
     new_left_pixels = int(abs(trg_left - src_left) / lon_res) + buffer_pixels
     new_right_pixels = int(abs(trg_right - src_right) / lon_res) + buffer_pixels
     new_bottom_pixels = int(abs(trg_bottom - src_bottom) / lat_res) + buffer_pixels
     new_top_pixels = int(abs(trg_top - src_top) / lat_res) + buffer_pixels
 
+    # keep source if they are already greater than the desired bounds
+    new_left_pixels = 0 if src_left < trg_left else new_left_pixels
+    new_right_pixels = 0 if src_right > trg_right else new_right_pixels
+    new_bottom_pixels = 0 if src_bottom < trg_bottom else new_bottom_pixels
+    new_top_pixels = 0 if src_top > trg_top else new_top_pixels
+
     # adjust the new bounds with even pixel multiples of existing
     new_trg_left = src_left - new_left_pixels * lon_res
-    new_trg_right = src_right + new_right_pixels * lon_res
-    new_trg_bottom = src_bottom - new_bottom_pixels * lat_res
     new_trg_top = src_top + new_top_pixels * lat_res
 
-    # keep source if they are already greater than the desired bounds
-    new_trg_left = src_left if src_left < trg_left else new_trg_left
-    new_trg_right = src_right if src_right > trg_right else new_trg_right
-    new_trg_bottom = src_bottom if src_bottom < trg_bottom else new_trg_bottom
-    new_trg_top = src_top if src_top < trg_top else new_trg_top
-
-    # Calculate the new width and height, should be integer values
-    new_width = int((new_trg_right - new_trg_left) / lon_res)
-    new_height = int((new_trg_top - new_trg_bottom) / lat_res)
+    # Calculate the new width and height from whole pixels
+    src_width, src_height = src_profile["width"], src_profile["height"]
+    new_width = src_width + new_left_pixels + new_right_pixels
+    new_height = src_height + new_top_pixels + new_bottom_pixels
 
     # Define the new transformation matrix
     transform = from_origin(new_trg_left, new_trg_top, lon_res, lat_res)
 
     # Create a new raster dataset with expanded bounds
-    fill_profile = src_profile.copy()
-    fill_profile.update(
+    trg_profile = src_profile.copy()
+    trg_profile.update(
         {"width": new_width, "height": new_height, "transform": transform}
     )
-    fill_array = np.full(
-        (1, new_height, new_width), fill_value=fill_value, dtype=src_profile["dtype"]
-    )
 
     if src_array is not None:
-        # if an existing src array (e.g. dem) is provided to expand
-        trg_array, trg_profile = merge_arrays_with_geometadata(
-            arrays=[src_array, fill_array],
-            profiles=[src_profile, fill_profile],
-            resampling="bilinear",
-            nodata=src_profile["nodata"],
+        # if an existing src array (e.g. dem) is provided to expand, it sits on the
+        # same grid as the expanded array so can be copied in at a pixel offset
+        trg_profile["count"] = src_array.shape[0]
+        trg_array = np.full(
+            (src_array.shape[0], new_height, new_width),
+            fill_value=fill_value,
             dtype=src_profile["dtype"],
-            method="first",
         )
+        src_window = trg_array[
+            :,
+            new_top_pixels : new_top_pixels + src_height,
+            new_left_pixels : new_left_pixels + src_width,
+        ]
+        np.copyto(src_window, src_array, where=valid, casting="unsafe")
     else:
         # we are not expanding an existing array
         # return the fill array that has been constructed based on the src_profile
-        trg_array, trg_profile = fill_array, fill_profile
+        trg_array = np.full(
+            (1, new_height, new_width),
+            fill_value=fill_value,
+            dtype=src_profile["dtype"],
+        )
     if save_path:
         with rasterio.open(save_path, "w", **trg_profile) as dst:
             dst.write(trg_array)
@@ -218,9 +357,16 @@ def read_vrt_in_bounds(
         # get all data in tiles
         if output_path:
             if set_nodata is not None:
-                gdal.Translate(output_path, vrt_path, noData=set_nodata)
+                gdal.Translate(
+                    output_path,
+                    vrt_path,
+                    noData=set_nodata,
+                    creationOptions=TIFF_CREATION_OPTIONS,
+                )
             else:
-                gdal.Translate(output_path, vrt_path)
+                gdal.Translate(
+                    output_path, vrt_path, creationOptions=TIFF_CREATION_OPTIONS
+                )
         if return_data:
             # Open the VRT file
             with rasterio.open(vrt_path) as src:
@@ -283,25 +429,53 @@ def read_vrt_in_bounds(
 
             # Save the extracted data to a new GeoTIFF
             if output_path:
-                with rasterio.open(output_path, "w", **arr_profile) as dst:
+                with rasterio.open(
+                    output_path, "w", **{**arr_profile, **TIFF_CREATION_PROFILE}
+                ) as dst:
                     dst.write(data, 1)
 
             if return_data:
                 return data[np.newaxis, :, :], arr_profile
 
 
+def merge_to_vrt(paths: list[str], vrt_path: str) -> str:
+    """Build a VRT mosaic of raster files at the highest resolution of the inputs
+
+    Parameters
+    ----------
+    paths : list[str]
+        paths to the rasters to merge
+    vrt_path : str
+        where to write the vrt
+
+    Returns
+    -------
+    str
+        path to the vrt
+    """
+    gdal.BuildVRT(str(vrt_path), paths, resolution="highest")
+    return vrt_path
+
+
 def merge_raster_files(
-    paths, output_path, bounds=None, return_data=True, buffer_pixels=0, delete_vrt=True
+    paths,
+    output_path,
+    bounds=None,
+    return_data=True,
+    buffer_pixels=0,
+    delete_vrt=True,
+    save_output=True,
 ):
-
     # Create a virtual raster (in-memory description of the merged DEMs)
     vrt_path = str(output_path).replace(".tif", ".vrt")  # Temporary VRT file path
-    gdal.BuildVRT(vrt_path, paths, resolution="highest")
+    merge_to_vrt(paths, vrt_path)
 
+    # data is read straight from the vrt, output_path is only written when
+    # the merged raster is needed on disk
     res = read_vrt_in_bounds(
         vrt_path=vrt_path,
         bounds=bounds,
-        output_path=output_path,
+        output_path=output_path if save_output else "",
         buffer_pixels=buffer_pixels,
         return_data=return_data,
     )
@@ -338,6 +512,16 @@ def merge_arrays_with_geometadata(
     if (len(arrays)) != (len(profiles)):
         raise ValueError("Length of arrays and profiles needs to be the same")
 
+    if method == "first" and grids_are_aligned(profiles):
+        # no resampling is needed, so place the arrays directly
+        merged_arr, merged_trans = merge_aligned_arrays(
+            arrays_input, profiles, nodata=nodata, dtype=dtype
+        )
+        merged_nodata, _ = resolve_merge_nodata(profiles, nodata=nodata, dtype=dtype)
+        return merged_arr, merged_profile_from_array(
+            profiles[0], merged_arr, merged_trans, nodata=merged_nodata, dtype=dtype
+        )
+
     memfiles = [MemoryFile() for p in profiles]
     datasets = [mfile.open(**p) for (mfile, p) in zip(memfiles, profiles)]
     [ds.write(arr) for (ds, arr) in zip(datasets, arrays_input)]
@@ -350,7 +534,26 @@ def merge_arrays_with_geometadata(
         dtype=dtype,
     )
 
-    prof_merged = profiles[0].copy()
+    merged_nodata, _ = resolve_merge_nodata(profiles, nodata=nodata, dtype=dtype)
+    prof_merged = merged_profile_from_array(
+        profiles[0], merged_arr, merged_trans, nodata=merged_nodata, dtype=dtype
+    )
+
+    [ds.close() for ds in datasets]
+    [mfile.close() for mfile in memfiles]
+
+    return merged_arr, prof_merged
+
+
+def merged_profile_from_array(
+    profile: dict,
+    merged_arr: np.ndarray,
+    merged_trans: Affine,
+    nodata: Union[float, int] = None,
+    dtype: str = None,
+) -> dict:
+    # profile describing a merged array, based on the profile of the first input
+    prof_merged = profile.copy()
     prof_merged["transform"] = merged_trans
     prof_merged["count"] = merged_arr.shape[0]
     prof_merged["height"] = merged_arr.shape[1]
@@ -359,11 +562,167 @@ def merge_arrays_with_geometadata(
         prof_merged["nodata"] = nodata
     if dtype is not None:
         prof_merged["dtype"] = dtype
+    return prof_merged
 
-    [ds.close() for ds in datasets]
-    [mfile.close() for mfile in memfiles]
 
-    return merged_arr, prof_merged
+def grids_are_aligned(profiles: list[dict], tolerance: float = 1e-6) -> bool:
+    """Check if rasters share a crs, band count and pixel size, and are offset
+    from each other by a whole number of pixels. Aligned rasters can be merged
+    without resampling.
+
+    Parameters
+    ----------
+    profiles : list[dict]
+        rasterio profiles of the rasters
+    tolerance : float, optional
+        allowed difference from a whole number of pixels, by default 1e-6
+
+    Returns
+    -------
+    bool
+        if the rasters are aligned
+    """
+    t0 = profiles[0]["transform"]
+    if not t0.is_rectilinear or t0.a <= 0 or t0.e >= 0:
+        return False
+    for p in profiles:
+        t = p["transform"]
+        if (
+            p.get("crs") != profiles[0].get("crs")
+            or p["count"] != profiles[0]["count"]
+            or t.b != 0
+            or t.d != 0
+            or abs(t.a - t0.a) > 1e-12
+            or abs(t.e - t0.e) > 1e-12
+        ):
+            return False
+        col_off = (t.c - t0.c) / t0.a
+        row_off = (t.f - t0.f) / t0.e
+        if abs(col_off - round(col_off)) > tolerance:
+            return False
+        if abs(row_off - round(row_off)) > tolerance:
+            return False
+    return True
+
+
+def resolve_merge_nodata(
+    profiles: list[dict], nodata: Union[float, int] = None, dtype: str = None
+) -> tuple[Union[float, int], bool]:
+    """Find the nodata value of a merged raster the same way as rasterio merge.
+    The requested nodata is used if the output dtype can hold it, otherwise the
+    nodata of the first profile is used.
+
+    Parameters
+    ----------
+    profiles : list[dict]
+        rasterio profiles of the rasters being merged
+    nodata : Union[float, int], optional
+        requested nodata of the output, by default None
+    dtype : str, optional
+        dtype of the output. If None, the dtype of the first profile is used
+
+    Returns
+    -------
+    tuple[Union[float, int], bool]
+        the nodata value (None if there is none), and if the output should be
+        initialised with it (otherwise the output is initialised with zeros)
+    """
+    dtype = dtype or profiles[0]["dtype"]
+    first_nodata = profiles[0].get("nodata")
+    nodataval = nodata if nodata is not None else first_nodata
+
+    if nodataval is None:
+        return None, False
+
+    if np.issubdtype(dtype, np.integer):
+        info = np.iinfo(dtype)
+        inrange = bool(np.isfinite(nodataval)) and info.min <= nodataval <= info.max
+    elif np.isfinite(nodataval):
+        info = np.finfo(dtype)
+        inrange = info.min <= nodataval <= info.max and np.can_cast(
+            np.min_scalar_type(nodataval), dtype
+        )
+    else:
+        inrange = True
+
+    if not inrange:
+        nodataval = first_nodata
+    return nodataval, inrange
+
+
+def nodata_mask(arr: np.ndarray, nodata: Union[float, int, None]) -> np.ndarray:
+    # boolean mask of nodata pixels, compared the same way as rasterio merge
+    if nodata is None:
+        return np.zeros(arr.shape, dtype=bool)
+    if np.isnan(nodata):
+        return np.isnan(arr)
+    if np.issubdtype(arr.dtype, np.integer):
+        return arr == nodata
+    return np.isclose(arr, nodata)
+
+
+def merge_aligned_arrays(
+    arrays: list[np.ndarray],
+    profiles: list[dict],
+    nodata: Union[float, int] = None,
+    dtype: str = None,
+) -> tuple[np.ndarray, Affine]:
+    """Merge arrays on aligned grids (see `grids_are_aligned`) by placing each
+    into the output at its pixel offset. Gives the same result as rasterio merge
+    with method='first', where earlier arrays take priority.
+
+    Parameters
+    ----------
+    arrays : list[np.ndarray]
+        arrays in BIP format i.e. channels x height x width
+    profiles : list[dict]
+        rasterio profiles of the arrays
+    nodata : Union[float, int], optional
+        nodata of the output. If None, or it can't be held by the output dtype,
+        the nodata of the first profile is used
+    dtype : str, optional
+        dtype of the output. If None, the dtype of the first profile is used
+
+    Returns
+    -------
+    tuple[np.ndarray, Affine]
+        merged array and its transform
+    """
+    t0 = profiles[0]["transform"]
+    x_res, y_res = t0.a, abs(t0.e)
+    dtype = dtype or profiles[0]["dtype"]
+    nodata, fill_with_nodata = resolve_merge_nodata(
+        profiles, nodata=nodata, dtype=dtype
+    )
+
+    all_bounds = [bounds_from_profile(p) for p in profiles]
+    dst_w = min(b[0] for b in all_bounds)
+    dst_s = min(b[1] for b in all_bounds)
+    dst_e = max(b[2] for b in all_bounds)
+    dst_n = max(b[3] for b in all_bounds)
+    width = int(round((dst_e - dst_w) / x_res))
+    height = int(round((dst_n - dst_s) / y_res))
+    transform = from_origin(dst_w, dst_n, x_res, y_res)
+
+    merged_arr = np.zeros((arrays[0].shape[0], height, width), dtype=dtype)
+    if fill_with_nodata:
+        merged_arr.fill(nodata)
+    # like rasterio merge, zero marks empty pixels when there is no nodata
+    nodata = 0 if nodata is None else nodata
+
+    for arr, p in zip(arrays, profiles):
+        t = p["transform"]
+        row_off = int(round((dst_n - t.f) / y_res))
+        col_off = int(round((t.c - dst_w) / x_res))
+        region = merged_arr[
+            :, row_off : row_off + p["height"], col_off : col_off + p["width"]
+        ]
+        arr = arr.astype(p["dtype"], copy=False)
+        # fill pixels that are still nodata with valid pixels from this array
+        fill = nodata_mask(region, nodata) & ~nodata_mask(arr, p.get("nodata"))
+        np.copyto(region, arr, where=fill, casting="unsafe")
+
+    return merged_arr, transform
 
 
 def read_raster_with_bounds(file_path, bounds, buffer_pixels=0):
@@ -396,14 +755,18 @@ def read_raster_with_bounds(file_path, bounds, buffer_pixels=0):
             max_y + buffer_y,
         )
 
-        # Create a window from the buffered bounds
-        window = from_bounds(*buffered_bounds, transform=src.transform)
+        # Create a window of whole pixels covering the buffered bounds
+        min_x, min_y, max_x, max_y = buffered_bounds
+        row_start, col_start = src.index(min_x, max_y, op=math.floor)
+        row_stop, col_stop = src.index(max_x, min_y, op=math.ceil)
 
         # Clip the window to the raster's extent to avoid out-of-bounds errors
-        window = window.intersection(src.window(*src.bounds))
+        row_start, col_start = max(0, row_start), max(0, col_start)
+        row_stop, col_stop = min(src.height, row_stop), min(src.width, col_stop)
+        window = Window.from_slices((row_start, row_stop), (col_start, col_stop))
 
         # Read the data within the window
-        data = src.read(window=window)
+        data = src.read(window=window, boundless=False)
 
         # Adjust the profile for the window
         profile = src.profile.copy()
@@ -143,6 +143,68 @@ def test_make_empty_cop30_dem(bounds, trg_shape):
     assert dem_arr.shape == trg_shape
 
 
+@pytest.mark.parametrize(
+    "trg_bounds",
+    [
+        (-179.8, -79.18, -179.2, -79.12),  # contained by the source
+        (-179.8, -79.18, -179.2, -79.0),  # extends north of the source
+    ],
+)
+@pytest.mark.parametrize("nodata", [-9999.0, np.nan])
+def test_expand_raster_to_bounds_fills_nodata(trg_bounds, nodata):
+    src_profile = make_empty_cop30m_profile((-179.9, -79.2, -179.1, -79.1))
+    src_profile["nodata"] = nodata
+    src_array = np.ones((src_profile["height"], src_profile["width"]), "float32")
+    src_array[10, 10] = nodata
+    dem_arr, dem_profile = expand_raster_to_bounds(
+        trg_bounds,
+        src_profile=src_profile,
+        src_array=src_array,
+        fill_value=0,
+        buffer_pixels=1,
+    )
+    new_rows = dem_arr.shape[1] - src_profile["height"]
+    assert dem_arr[0, new_rows + 10, 10] == 0
+    assert np.count_nonzero(dem_arr[:, new_rows:]) == src_array.size - 1
+
+
+def test_expand_raster_to_bounds_contained_source():
+    src_profile = make_empty_cop30m_profile((-179.9, -79.2, -179.1, -79.1))
+    src_array = np.ones((src_profile["height"], src_profile["width"]), "float32")
+    src_array[10, 10] = np.nan
+    dem_arr, dem_profile = expand_raster_to_bounds(
+        (-179.8, -79.18, -179.2, -79.12),
+        src_profile=src_profile,
+        src_array=src_array,
+        fill_value=0,
+        buffer_pixels=1,
+    )
+    assert dem_arr.shape == (1, *src_array.shape)
+    assert dem_profile["transform"] == src_profile["transform"]
+    assert dem_arr[0, 10, 10] == 0
+    assert np.isnan(src_array[10, 10])  # the source array is not modified
+
+
+def test_expand_raster_to_bounds_target_north_of_source():
+    bounds = (-179.8, -79.18, -179.2, -79.0)
+    src_profile = make_empty_cop30m_profile((-179.9, -79.2, -179.1, -79.1))
+    src_array = np.ones((src_profile["height"], src_profile["width"]), "float32")
+    dem_arr, dem_profile = expand_raster_to_bounds(
+        bounds,
+        src_profile=src_profile,
+        src_array=src_array,
+        fill_value=0,
+        buffer_pixels=1,
+    )
+    dem_bounds = bounds_from_profile(dem_profile)
+    new_rows = dem_arr.shape[1] - src_profile["height"]
+    assert box(*bounds).within(box(*dem_bounds))
+    assert new_rows > 0
+    assert dem_arr.shape[2] == src_profile["width"]
+    assert (dem_arr[:, :new_rows] == 0).all()
+    assert (dem_arr[:, new_rows:] == 1).all()
+
+
 @pytest.mark.parametrize(
     "bounds, buffer, expanded_bounds",
     [
@@ -267,6 +329,22 @@ def test_dem_read_for_bounds(bounds, trg_shape, buffer_pixels):
     assert dem_arr.shape == trg_shape
 
 
+def test_dem_read_for_bounds_without_saving_output():
+    bounds = (-179.9, -79.2, -179.1, -79.1)
+    output_path = CURRENT_DIR / Path("TMP") / Path("TMP.tif")
+    os.makedirs(output_path.parent, exist_ok=True)
+    dem_tiles = find_required_dem_paths_from_index(
+        bounds, cop30_index_path=TEST_COP30_INDEX_PATH
+    )
+    dem_arr, dem_profile = merge_raster_files(
+        dem_tiles, output_path=output_path, bounds=bounds, save_output=False
+    )
+    output_written = output_path.exists()
+    shutil.rmtree(output_path.parent)
+    assert not output_written
+    assert dem_arr.shape == (1, 362, 962)
+
+
 @pytest.mark.parametrize(
     "bounds, trg_shape, geoid_ref_mean, ellipsoid_ref_mean",
     [
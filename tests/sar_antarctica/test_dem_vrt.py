@@ -2,24 +2,46 @@ from sar_antarctica.nci.preparation.create_dem_vrt import (
     find_tiles,
     build_vrt,
     build_tileindex,
+    build_gti,
+    parse_copdem_tile_bounds,
+    filter_tiles_to_bounds,
+    build_vrt_for_bounds,
+    create_glo30_dem_south_vrt,
+    remove_source_block_sizes,
 )
 
 from pathlib import Path
 import os
+import pytest
+import xml.etree.ElementTree as ET
 
 CURRENT_DIR = Path(__file__).parent.resolve()
 TEST_DATA_PATH = CURRENT_DIR / Path("data/copernicus_30m_world")
 
 EXPECTED_DATA_FILES = [
-    TEST_DATA_PATH / "Copernicus_DSM_COG_10_S80_00_E178_00_DEM.tif",
-    TEST_DATA_PATH / "Copernicus_DSM_COG_10_S80_00_E179_00_DEM.tif",
-    TEST_DATA_PATH / "Copernicus_DSM_COG_10_S80_00_W180_00_DEM.tif",
+    str(TEST_DATA_PATH / "Copernicus_DSM_COG_10_S80_00_E178_00_DEM.tif"),
+    str(TEST_DATA_PATH / "Copernicus_DSM_COG_10_S80_00_E179_00_DEM.tif"),
+    str(TEST_DATA_PATH / "Copernicus_DSM_COG_10_S80_00_W180_00_DEM.tif"),
 ]
 EXPECTED_VRT_FILE = TEST_DATA_PATH / "copdem_test.vrt"
 
-TEST_FILE_LIST_PATH = Path("temp.txt")
 TEST_VRT_PATH = TEST_DATA_PATH / "temp.vrt"
 TEST_TINDEX_PATH = TEST_DATA_PATH / "temp.gpkg"
+TEST_GTI_PATH = TEST_DATA_PATH / "temp.gti.gpkg"
+
+TEST_VRT_XML = """<VRTDataset rasterXSize="7200" rasterYSize="3600">
+  <VRTRasterBand dataType="Float32" band="1">
+    <ComplexSource>
+      <SourceFilename relativeToVRT="0">tile_0.tif</SourceFilename>
+      <SourceProperties RasterXSize="3600" RasterYSize="3600" BlockXSize="3600" BlockYSize="1" />
+    </ComplexSource>
+    <ComplexSource>
+      <SourceFilename relativeToVRT="0">tile_1.tif</SourceFilename>
+      <SourceProperties RasterXSize="3600" RasterYSize="3600" BlockXSize="512" BlockYSize="512" />
+    </ComplexSource>
+  </VRTRasterBand>
+</VRTDataset>
+"""
 
 
 tiles = find_tiles(TEST_DATA_PATH, "Copernicus_DSM_COG_10_???_00_????_00_DEM.tif")
@@ -30,29 +52,221 @@ def test_find_tiles_for_vrt():
     assert set(list_tiles) == set(EXPECTED_DATA_FILES)
 
 
+def test_find_tiles_in_tile_directories(tmp_path):
+    source_dir = tmp_path / "dem"
+    source_dir.mkdir()
+    expected = []
+    for name in ["S80_00_E178_00", "S80_00_W180_00"]:
+        tile_dir = source_dir / f"Copernicus_DSM_COG_10_{name}_DEM"
+        tile_dir.mkdir()
+        (tile_dir / f"Copernicus_DSM_COG_10_{name}_DEM.tif").touch()
+        expected.append(str(tile_dir / f"Copernicus_DSM_COG_10_{name}_DEM.tif"))
+
+    # Symlinked tile directories are followed, as with Path.rglob
+    linked_dir = tmp_path / "linked" / "Copernicus_DSM_COG_10_S79_00_E178_00_DEM"
+    linked_dir.mkdir(parents=True)
+    (linked_dir / "Copernicus_DSM_COG_10_S79_00_E178_00_DEM.tif").touch()
+    symlink = source_dir / linked_dir.name
+    symlink.symlink_to(linked_dir, target_is_directory=True)
+    expected.append(str(symlink / "Copernicus_DSM_COG_10_S79_00_E178_00_DEM.tif"))
+
+    # Tiles outside the pattern are skipped
+    north_dir = source_dir / "Copernicus_DSM_COG_10_N05_00_E012_00_DEM"
+    north_dir.mkdir()
+    (north_dir / "Copernicus_DSM_COG_10_N05_00_E012_00_DEM.tif").touch()
+    (north_dir.parent / "Copernicus_DSM_COG_10_S80_00_E178_00_DEM.xml").touch()
+
+    pattern = "Copernicus_DSM_COG_10_S??_00_????_00_DEM/*.tif"
+    tiles = list(find_tiles(source_dir, pattern, workers=2))
+
+    assert sorted(tiles) == sorted(expected)
+    assert sorted(tiles) == sorted(str(p) for p in source_dir.rglob(pattern))
+
+
+def test_find_tiles_skips_unreadable_directories(tmp_path, monkeypatch):
+    for name in ["S80_00_E178_00", "S80_00_E179_00"]:
+        tile_dir = tmp_path / f"Copernicus_DSM_COG_10_{name}_DEM"
+        tile_dir.mkdir()
+        (tile_dir / f"Copernicus_DSM_COG_10_{name}_DEM.tif").touch()
+    unreadable_dir = str(tmp_path / "Copernicus_DSM_COG_10_S80_00_E179_00_DEM")
+
+    scandir = os.scandir
+
+    def scandir_with_unreadable_dir(path):
+        if os.fspath(path) == unreadable_dir:
+            raise PermissionError(13, "Permission denied", path)
+        return scandir(path)
+
+    monkeypatch.setattr(os, "scandir", scandir_with_unreadable_dir)
+    tiles = list(find_tiles(tmp_path, "Copernicus_DSM_COG_10_S??_00_????_00_DEM/*.tif"))
+
+    assert tiles == [
+        str(
+            tmp_path
+            / "Copernicus_DSM_COG_10_S80_00_E178_00_DEM"
+            / "Copernicus_DSM_COG_10_S80_00_E178_00_DEM.tif"
+        )
+    ]
+
+
+@pytest.mark.parametrize(
+    "tile, bounds",
+    [
+        (EXPECTED_DATA_FILES[0], (178, -80, 179, -79)),
+        (EXPECTED_DATA_FILES[2], (-180, -80, -179, -79)),
+        (
+            "Copernicus_DSM_COG_10_N05_00_E012_00_DEM/Copernicus_DSM_COG_10_N05_00_E012_00_DEM.tif",
+            (12, 5, 13, 6),
+        ),
+    ],
+)
+def test_parse_copdem_tile_bounds(tile, bounds):
+    assert parse_copdem_tile_bounds(tile) == bounds
+
+
+def test_parse_copdem_tile_bounds_invalid():
+    with pytest.raises(ValueError):
+        parse_copdem_tile_bounds("not_a_dem_tile.tif")
+
+
+def test_filter_tiles_to_bounds():
+    tiles = list(filter_tiles_to_bounds(list_tiles, (178.2, -79.8, 178.8, -79.2)))
+    assert tiles == [EXPECTED_DATA_FILES[0]]
+
+
 def test_build_vrt():
-    build_vrt(list_tiles, TEST_VRT_PATH, run=False)
-    assert TEST_FILE_LIST_PATH.exists
+    file_list_path = build_vrt(list_tiles, TEST_VRT_PATH, run=False)
+    assert file_list_path.exists()
 
-    with open(TEST_FILE_LIST_PATH, "r") as f:
-        lines = [Path(line.rstrip()) for line in f.readlines()]
+    with open(file_list_path, "r") as f:
+        lines = [line.rstrip() for line in f.readlines()]
     assert lines == list_tiles
+    os.remove(file_list_path)
 
     build_vrt(list_tiles, TEST_VRT_PATH, run=True)
-    assert TEST_VRT_PATH.exists
+    assert TEST_VRT_PATH.exists()
 
     os.remove(TEST_VRT_PATH)
 
 
+def test_remove_source_block_sizes(tmp_path):
+    vrt_path = tmp_path / "test.vrt"
+    vrt_path.write_text(TEST_VRT_XML)
+
+    remove_source_block_sizes(vrt_path)
+
+    tree = ET.parse(vrt_path)
+    filenames = [e.text for e in tree.iter("SourceFilename")]
+    assert filenames == ["tile_0.tif", "tile_1.tif"]
+    properties = [e.attrib for e in tree.iter("SourceProperties")]
+    expected_properties = {"RasterXSize": "3600", "RasterYSize": "3600"}
+    assert properties == [expected_properties, expected_properties]
+    assert tree.getroot().attrib == {"rasterXSize": "7200", "rasterYSize": "3600"}
+
+
 def test_build_tindex():
-    build_tileindex(list_tiles, TEST_TINDEX_PATH, run=False)
-    assert TEST_FILE_LIST_PATH.exists
+    file_list_path = build_tileindex(list_tiles, TEST_TINDEX_PATH, run=False)
+    assert file_list_path.exists()
 
-    with open(TEST_FILE_LIST_PATH, "r") as f:
-        lines = [Path(line.rstrip()) for line in f.readlines()]
+    with open(file_list_path, "r") as f:
+        lines = [line.rstrip() for line in f.readlines()]
     assert lines == list_tiles
+    os.remove(file_list_path)
 
     build_tileindex(list_tiles, TEST_TINDEX_PATH, run=True)
-    assert TEST_TINDEX_PATH.exists
+    assert TEST_TINDEX_PATH.exists()
 
     os.remove(TEST_TINDEX_PATH)
+
+
+def test_build_gti():
+    file_list_path = build_gti(list_tiles, TEST_GTI_PATH, run=False)
+    assert file_list_path.exists()
+
+    with open(file_list_path, "r") as f:
+        lines = [line.rstrip() for line in f.readlines()]
+    assert lines == list_tiles
+    os.remove(file_list_path)
+
+    build_gti(list_tiles, TEST_GTI_PATH, run=True)
+    assert TEST_GTI_PATH.exists()
+
+    os.remove(TEST_GTI_PATH)
+
+
+def test_build_vrt_for_bounds(tmp_path):
+    bounds = (178.2, -79.8, 179.8, -79.2)
+    pattern = "Copernicus_DSM_COG_10_???_00_????_00_DEM.tif"
+    vrt_path = build_vrt_for_bounds(
+        bounds, cache_dir=tmp_path, source_dir=TEST_DATA_PATH, pattern=pattern
+    )
+    assert vrt_path.exists()
+    assert list(tmp_path.iterdir()) == [vrt_path]
+
+    with open(vrt_path, "r") as f:
+        vrt = f.read()
+    assert "E178" in vrt and "E179" in vrt and "W180" not in vrt
+
+    # cached VRT is returned for the same bounds
+    assert (
+        build_vrt_for_bounds(
+            bounds, cache_dir=tmp_path, source_dir=TEST_DATA_PATH, pattern=pattern
+        )
+        == vrt_path
+    )
+
+    # a different tile source gets its own VRT
+    assert (
+        build_vrt_for_bounds(
+            bounds,
+            cache_dir=tmp_path,
+            source_dir=TEST_DATA_PATH,
+            pattern="Copernicus_DSM_COG_10_S80_00_????_00_DEM.tif",
+        )
+        != vrt_path
+    )
+
+
+def test_build_vrt_for_bounds_failed_build(tmp_path, monkeypatch):
+    def failing_build_vrt(tiles, vrt_path):
+        Path(vrt_path).write_text("partial")
+        raise RuntimeError("gdalbuildvrt failed")
+
+    monkeypatch.setattr(
+        "sar_antarctica.nci.preparation.create_dem_vrt.build_vrt", failing_build_vrt
+    )
+    with pytest.raises(RuntimeError):
+        build_vrt_for_bounds(
+            (178.2, -79.8, 179.8, -79.2),
+            cache_dir=tmp_path,
+            source_dir=TEST_DATA_PATH,
+            pattern="Copernicus_DSM_COG_10_???_00_????_00_DEM.tif",
+        )
+    assert list(tmp_path.iterdir()) == []
+
+
+@pytest.mark.parametrize(
+    "supports_gti, index_name",
+    [(True, "copdem_south.gti.gpkg"), (False, "copdem_south.vrt")],
+)
+def test_create_glo30_dem_south_vrt_for_aoi(
+    tmp_path, monkeypatch, supports_gti, index_name
+):
+    module = "sar_antarctica.nci.preparation.create_dem_vrt"
+    built = []
+    monkeypatch.setattr(f"{module}.COP30_SOURCE_DIR", TEST_DATA_PATH)
+    monkeypatch.setattr(f"{module}.gdal_supports_gti", lambda: supports_gti)
+    monkeypatch.setattr(f"{module}.build_gti", lambda tiles, path: built.append(path))
+    monkeypatch.setattr(f"{module}.build_vrt", lambda tiles, path: built.append(path))
+
+    index_path = create_glo30_dem_south_vrt(
+        aoi_bounds=(178.2, -79.8, 179.8, -79.2), output_dir=tmp_path
+    )
+
+    assert index_path == tmp_path / index_name
+    assert built == [index_path]
+
+
+def test_create_glo30_dem_south_vrt_aoi_requires_output_dir():
+    with pytest.raises(ValueError):
+        create_glo30_dem_south_vrt(aoi_bounds=(178.2, -79.8, 179.8, -79.2))
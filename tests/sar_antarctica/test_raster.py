@@ -0,0 +1,230 @@
+import numpy as np
+import pytest
+import rasterio
+from rasterio.crs import CRS
+from rasterio.enums import Resampling
+from rasterio.io import MemoryFile
+from rasterio.merge import merge
+from rasterio.transform import from_origin
+from rasterio.warp import calculate_default_transform, reproject
+
+from sar_antarctica.utils.raster import (
+    merge_arrays_with_geometadata,
+    grids_are_aligned,
+    merge_aligned_arrays,
+    nodata_mask,
+    reproject_raster,
+    reproject_rasters,
+    read_vrt_in_bounds,
+)
+
+
+def make_profile(left, top, width, height, dtype, nodata, res=0.5):
+    return {
+        "driver": "GTiff",
+        "dtype": dtype,
+        "nodata": nodata,
+        "width": width,
+        "height": height,
+        "count": 1,
+        "crs": CRS.from_epsg(4326),
+        "transform": from_origin(left, top, res, res),
+    }
+
+
+def rasterio_merge(arrays, profiles, nodata, dtype):
+    memfiles = [MemoryFile() for p in profiles]
+    datasets = [mfile.open(**p) for (mfile, p) in zip(memfiles, profiles)]
+    [ds.write(arr) for (ds, arr) in zip(datasets, arrays)]
+    merged_arr, merged_trans = merge(
+        datasets,
+        resampling=Resampling.bilinear,
+        method="first",
+        nodata=nodata,
+        dtype=dtype,
+    )
+    [ds.close() for ds in datasets]
+    [mfile.close() for mfile in memfiles]
+    return merged_arr, merged_trans
+
+
+@pytest.mark.parametrize(
+    "dtype, src_nodata, nodata",
+    [
+        ("float32", -9999.0, -9999.0),
+        ("float32", np.nan, np.nan),
+        ("float32", None, None),
+        ("int16", 0, np.nan),  # nan can't be held by int16, source nodata used
+        ("int16", -1, None),
+    ],
+)
+@pytest.mark.parametrize(
+    "second_origin", [(3, 12), (20, 0), (0.25, 10)]  # overlap, apart, unaligned
+)
+def test_merge_arrays_matches_rasterio_merge(dtype, src_nodata, nodata, second_origin):
+    rng = np.random.default_rng(0)
+    first = (rng.random((1, 10, 10)) * 100 + 1).astype(dtype)
+    second = (rng.random((1, 8, 10)) * 100 + 1).astype(dtype)
+    first[0, 1, 1] = 0 if src_nodata is None else src_nodata
+    profiles = [
+        make_profile(0, 10, 10, 10, dtype, src_nodata),
+        make_profile(*second_origin, 10, 8, dtype, src_nodata),
+    ]
+
+    merged_arr, merged_profile = merge_arrays_with_geometadata(
+        [first, second], profiles, nodata=nodata, dtype=dtype
+    )
+    expected_arr, expected_trans = rasterio_merge(
+        [first, second], profiles, nodata=nodata, dtype=dtype
+    )
+
+    assert merged_arr.dtype == expected_arr.dtype
+    np.testing.assert_array_equal(merged_arr, expected_arr)
+    assert merged_profile["transform"] == expected_trans
+    if np.issubdtype(dtype, np.integer):
+        assert merged_profile["nodata"] == src_nodata
+
+
+def test_merge_arrays_keeps_integer_data_with_default_nodata():
+    profiles = [
+        make_profile(0, 10, 4, 4, "int16", 0),
+        make_profile(2, 10, 4, 4, "int16", 0),
+    ]
+    arrays = [np.full((1, 4, 4), 7, "int16"), np.full((1, 4, 4), 9, "int16")]
+
+    merged_arr, merged_profile = merge_arrays_with_geometadata(
+        arrays, profiles, dtype="int16"
+    )
+
+    assert merged_profile["nodata"] == 0
+    assert (merged_arr[0, :, :4] == 7).all()
+    assert (merged_arr[0, :, 4:] == 9).all()
+
+
+@pytest.mark.parametrize(
+    "second_profile, aligned",
+    [
+        (make_profile(3, 12, 10, 8, "float32", np.nan), True),
+        (make_profile(0.25, 10, 10, 10, "float32", np.nan), False),
+        (make_profile(3, 12, 10, 8, "float32", np.nan, res=0.25), False),
+        ({**make_profile(3, 12, 10, 8, "float32", np.nan), "crs": None}, False),
+    ],
+)
+def test_grids_are_aligned(second_profile, aligned):
+    first_profile = make_profile(0, 10, 10, 10, "float32", np.nan)
+    assert grids_are_aligned([first_profile, second_profile]) == aligned
+
+
+def test_grids_are_aligned_minimal_profiles():
+    profiles = [
+        {"transform": from_origin(0, 10, 1, 1), "count": 1},
+        {"transform": from_origin(5, 10, 1, 1), "count": 1},
+    ]
+    assert grids_are_aligned(profiles)
+
+
+def test_merge_aligned_arrays():
+    profiles = [
+        make_profile(0, 10, 2, 2, "float32", np.nan, res=1),
+        make_profile(1, 10, 2, 2, "float32", np.nan, res=1),
+    ]
+    arrays = [
+        np.array([[[1, np.nan], [1, 1]]], "float32"),
+        np.array([[[2, 2], [2, 2]]], "float32"),
+    ]
+
+    merged_arr, merged_trans = merge_aligned_arrays(arrays, profiles)
+
+    np.testing.assert_array_equal(merged_arr, [[[1, 2, 2], [1, 1, 2]]])
+    assert merged_trans == from_origin(0, 10, 1, 1)
+
+
+@pytest.mark.parametrize(
+    "arr, nodata, expected",
+    [
+        (np.array([1.0, np.nan]), np.nan, [False, True]),
+        (np.array([1.0, -9999.0]), -9999.0, [False, True]),
+        (np.array([1, 0], "int16"), 0, [False, True]),
+        (np.array([1.0, 0.0]), None, [False, False]),
+    ],
+)
+def test_nodata_mask(arr, nodata, expected):
+    np.testing.assert_array_equal(nodata_mask(arr, nodata), expected)
+
+
+def test_reproject_rasters(tmp_path):
+    src_dir, out_dir = tmp_path / "src", tmp_path / "out"
+    src_dir.mkdir()
+    out_dir.mkdir()
+    src_paths = []
+    for i, left in enumerate([160, 161]):
+        src_path = str(src_dir / f"raster_{i}.tif")
+        profile = make_profile(left, -75, 20, 10, "float32", np.nan, res=0.05)
+        with rasterio.open(src_path, "w", **profile) as dst:
+            dst.write(np.full((1, 10, 20), i + 1, "float32"))
+        src_paths.append(src_path)
+
+    out_paths = reproject_rasters(src_paths, str(out_dir), 3031, workers=2)
+
+    assert out_paths == [str(out_dir / "raster_0.tif"), str(out_dir / "raster_1.tif")]
+    for i, out_path in enumerate(out_paths):
+        with rasterio.open(out_path) as src:
+            assert src.crs.to_epsg() == 3031
+            data = src.read(1)
+        assert (data[~np.isnan(data)] == i + 1).all()
+
+
+def test_reproject_raster_matches_reproject(tmp_path):
+    # the warped vrt linearises the transform per block rather than over the whole
+    # output, so a small fraction of nearest neighbour picks differ from reproject
+    src_path, out_path = str(tmp_path / "src.tif"), str(tmp_path / "out.tif")
+    profile = make_profile(160, -70, 400, 300, "float32", np.nan, res=0.01)
+    profile["count"] = 2
+    rng = np.random.default_rng(0)
+    with rasterio.open(src_path, "w", **profile) as dst:
+        dst.write(rng.random((2, 300, 400)).astype("float32"))
+
+    reproject_raster(src_path, out_path, 3031)
+
+    with rasterio.open(src_path) as src:
+        transform, width, height = calculate_default_transform(
+            src.crs, "EPSG:3031", src.width, src.height, *src.bounds
+        )
+        expected = np.full((2, height, width), np.nan, "float32")
+        reproject(
+            src.read(),
+            expected,
+            src_transform=src.transform,
+            src_crs=src.crs,
+            dst_transform=transform,
+            dst_crs="EPSG:3031",
+            resampling=Resampling.nearest,
+            src_nodata=np.nan,
+            dst_nodata=np.nan,
+        )
+    with rasterio.open(out_path) as src:
+        assert src.transform == transform
+        data = src.read()
+
+    np.testing.assert_array_equal(np.isnan(data), np.isnan(expected))
+    valid = ~np.isnan(expected)
+    mismatch = np.count_nonzero(data[valid] != expected[valid]) / np.count_nonzero(
+        valid
+    )
+    assert mismatch < 0.02
+
+
+def test_read_vrt_in_bounds_writes_tiled_compressed_output(tmp_path):
+    src_path, out_path = str(tmp_path / "src.tif"), str(tmp_path / "out.tif")
+    profile = make_profile(0, 10, 20, 20, "float32", np.nan)
+    with rasterio.open(src_path, "w", **profile) as dst:
+        dst.write(np.ones((1, 20, 20), "float32"))
+
+    arr, arr_profile = read_vrt_in_bounds(src_path, (2, 2, 8, 8), output_path=out_path)
+
+    with rasterio.open(out_path) as src:
+        assert src.profile["tiled"]
+        assert src.profile["compress"] == "deflate"
+        assert src.block_shapes == [(512, 512)]
+        np.testing.assert_array_equal(src.read(), arr)
+    assert "compress" not in arr_profile